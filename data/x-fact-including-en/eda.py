@@ -1,21 +1,32 @@
-import pandas as pd
-import csv
-import json
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pa_csv
+import orjson
+from pathlib import Path
 
 # 5 yo change
 
-tsv = pd.read_csv('test.all.tsv', sep='\t', index_col=False, on_bad_lines='skip')
+columns = ['claimDate', 'claim', 'label']
+tsv = pa_csv.read_csv(
+    'test.all.tsv',
+    # some quoted claims span several lines
+    parse_options=pa_csv.ParseOptions(delimiter='\t', newlines_in_values=True, invalid_row_handler=lambda row: 'skip'),
+    convert_options=pa_csv.ConvertOptions(include_columns=columns, column_types={c: pa.string() for c in columns}),
+)
 print(tsv.shape)
-df = tsv[['claimDate','claim','label']]
-df['exp_split'] = 'test'
-print(df.shape)
 
-# take years
-df['claimDate'] = df.claimDate.astype(str).str[:4]
 # take only true and false
 print(' -------- take only true and false')
-print(df['label'].value_counts())
-df = df.loc[(df['label'] == 'false') | (df['label'] == 'true')]
+print(pc.value_counts(tsv['label']))
+tsv = tsv.filter(pc.is_in(tsv['label'], value_set=pa.array(['false', 'true'])))
+
+# take years
+tsv = tsv.set_column(tsv.schema.get_field_index('claimDate'), 'claimDate', pc.utf8_slice_codeunits(tsv['claimDate'], 0, 4))
+
+df = tsv.to_pandas()
+df['exp_split'] = 'test'
+print(df.shape)
+
 print('count label unique values')
 print(df['label'].value_counts())
 
@@ -23,7 +34,7 @@ print(df['label'].value_counts())
 
 df['annotation_id'] = 'placeholder'
 df['label_id'] = df['label']
-df['label']=df['label'].replace({'false':0, 'true':1})
+df['label'] = df['label'].map({'false': 0, 'true': 1}).astype('int8')
 print(df['label'].value_counts())
 print(df)
 
@@ -48,38 +59,15 @@ print(Bi2016.head())
 
 
 
-def csv_to_json(csvFilePath, jsonFilePath):
-   jsonArray = []
-
-   # read csv file
-   with open(csvFilePath) as csvf:
-      # load csv file data using csv library's dictionary reader
-      csvReader = csv.DictReader(csvf)
-
-      # convert each csv row into python dict
-      for row in csvReader:
-         # print(row['label'])
-         row['label'] = int(row['label'])
-
-         # add this python dict to json array
-         jsonArray.append(row)
-
-   # convert python jsonArray to JSON String and write to file
-   with open(jsonFilePath, 'w') as jsonf:
-      jsonString = json.dumps(jsonArray, indent=4)
-      jsonf.write(jsonString)
-
+def frame_to_json(frame, jsonFilePath):
+   # serialize the records straight from the frame, no intermediate csv file
+   frame = frame.astype({'label': int})
+   Path(jsonFilePath).write_bytes(orjson.dumps(frame.to_dict(orient='records'), option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
 
 
-Bi2020.to_csv('dev.csv', index = False)
-csvFilePath = 'dev.csv'
-csv_to_json(csvFilePath, 'Bi2020_test.json')
 
-Bi2018.to_csv('dev.csv', index = False)
-csvFilePath = 'dev.csv'
-csv_to_json(csvFilePath, 'Bi2018_test.json')
+frame_to_json(Bi2020, 'Bi2020_test.json')
 
-Bi2016.to_csv('dev.csv', index = False)
-csvFilePath = 'dev.csv'
-csv_to_json(csvFilePath, 'Bi2016_test.json')
+frame_to_json(Bi2018, 'Bi2018_test.json')
 
+frame_to_json(Bi2016, 'Bi2016_test.json')
@@ -42,8 +42,12 @@ from xfact_evidence import xfact_claim_evidence_convert_examples_to_features as
 from transformers import xfact_compute_metrics as compute_metrics
 from xfact_evidence import xfact_evidence_output_modes as output_modes
 from xfact_evidence import xfact_evidence_processors as processors
+from xfact_evidence import xfact_evidence_features_cache_key
+from xfact_evidence import load_xfact_evidence_features, save_xfact_evidence_features
+from xfact_evidence import xfact_evidence_features_cache_exists
 
 import shutil
+from filelock import FileLock
 
 try:
     from torch.utils.tensorboard import SummaryWriter
@@ -403,87 +407,57 @@ def load_and_cache_examples(args, task, tokenizer, processor, evaluate=False, fi
     for source in sources:
         # Load data features from cache or dataset file
         if filename is None:
-            if not args.use_metadata:
-                cached_features_file = os.path.join(
-                    args.data_dir,
-                    "cached_{}_{}_{}_{}_{}_attn_num_evidences_{}".format(
-                        "dev" if evaluate else "train",
-                        list(filter(None, args.model_name_or_path.split("/"))).pop(),
-                        str(args.max_seq_length),
-                        str(task),
-                        str(source),
-                        str(args.num_evidences)
-                    ),
-                )
-            else:
-                cached_features_file = os.path.join(
-                    args.data_dir,
-                    "cached_{}_{}_{}_{}_{}_{}_attn_num_evidences_{}".format(
-                        "dev" if evaluate else "train",
-                        list(filter(None, args.model_name_or_path.split("/"))).pop(),
-                        str(args.max_seq_length),
-                        str(task),
-                        str(source),
-                        str('metadata'),
-                        str(args.num_evidences)
-                    ),
-                )
+            split = "dev" if evaluate else "train"
+            input_file = os.path.join(args.data_dir, "{}.{}.tsv".format(split, source))
         else:
-            if not args.use_metadata:
-                cached_features_file = os.path.join(
-                    args.data_dir,
-                    "cached_{}_{}_{}_{}_{}_attn_num_evidences_{}".format(
-                        filename.replace('.tsv', ''),
-                        list(filter(None, args.model_name_or_path.split("/"))).pop(),
-                        str(args.max_seq_length),
-                        str(task),
-                        str(source),
-                        str(args.num_evidences)
-                    ),
-                )
+            split = filename.replace('.tsv', '')
+            input_file = os.path.join(args.data_dir, filename)
+        label_list = list(processor.get_labels()[source])
+        cache_key = xfact_evidence_features_cache_key(
+            input_file,
+            tokenizer,
+            args.tokenizer_name if args.tokenizer_name else args.model_name_or_path,
+            args.max_seq_length,
+            args.num_evidences,
+            args.use_metadata,
+            label_list,
+            convert_examples_to_features,
+        )
+        cached_features_file = os.path.join(args.data_dir, "cached_{}_{}_{}".format(split, source, cache_key))
+
+        # Make sure only one process at a time builds the cache; concurrent runs will load it
+        with FileLock(cached_features_file + ".lock"):
+            if xfact_evidence_features_cache_exists(cached_features_file) and not args.overwrite_cache:
+                logger.info("Loading features from cached file %s", cached_features_file)
+                features = load_xfact_evidence_features(cached_features_file)
             else:
-                cached_features_file = os.path.join(
-                    args.data_dir,
-                    "cached_{}_{}_{}_{}_{}_{}_attn_num_evidences_{}".format(
-                        filename.replace('.tsv', ''),
-                        list(filter(None, args.model_name_or_path.split("/"))).pop(),
-                        str(args.max_seq_length),
-                        str(task),
-                        str(source),
-                        str('metadata'),
-                        str(args.num_evidences)
-                    ),
+                logger.info("Creating features from dataset file at %s", args.data_dir)
+                print(label_list)
+                examples = (
+                    processor.get_dev_examples(args.data_dir, source, filename=filename) if evaluate else processor.get_train_examples(args.data_dir, source)
                 )
-
-        if os.path.exists(cached_features_file) and not args.overwrite_cache:
-            logger.info("Loading features from cached file %s", cached_features_file)
-            features = torch.load(cached_features_file)
-        else:
-            logger.info("Creating features from dataset file at %s", args.data_dir)
-            label_list = list(processor.get_labels()[source])
-            print(label_list)
-            examples = (
-                processor.get_dev_examples(args.data_dir, source, filename=filename) if evaluate else processor.get_train_examples(args.data_dir, source)
-            )
-            #features = convert_examples_to_features(
-            #    examples, tokenizer, max_length=args.max_seq_length, label_list=label_list, output_mode=output_mode,
-            #)
-            features = convert_examples_to_features(
-                examples, label_list, args.max_seq_length, tokenizer
-            )
-            if args.local_rank in [-1, 0]:
-                logger.info("Saving features into cached file %s", cached_features_file)
-                torch.save(features, cached_features_file)
+                features = convert_examples_to_features(
+                    examples,
+                    label_list,
+                    args.max_seq_length,
+                    tokenizer,
+                    threads=args.threads,
+                    num_evidences=args.num_evidences,
+                )
+                if args.local_rank in [-1, 0]:
+                    logger.info("Saving features into cached file %s", cached_features_file)
+                    save_xfact_evidence_features(features, cached_features_file)
 
         if args.local_rank == 0 and not evaluate:
             torch.distributed.barrier()  # Make sure only the first process in distributed training process the dataset, and the others will use the cache
 
         # Convert to Tensors and build dataset
-        all_input_ids = torch.tensor([f.input_ids for f in features], dtype=torch.long)
-        all_attention_mask = torch.tensor([f.attention_mask for f in features], dtype=torch.long)
-        all_token_type_ids = torch.tensor([f.token_type_ids for f in features], dtype=torch.long)
+        # Zero-copy views on the feature arrays, rows are only read when a batch is collated
+        all_input_ids = torch.from_numpy(features.input_ids)
+        all_attention_mask = torch.from_numpy(features.attention_mask)
+        all_token_type_ids = torch.from_numpy(features.token_type_ids)
         if output_mode == "classification":
-            all_labels = torch.tensor([f.label for f in features], dtype=torch.long)
+            all_labels = torch.from_numpy(features.labels)
         else:
             raise ValueError("No other `output_mode` for XFACT.")
 
@@ -598,6 +572,7 @@ def main():
     parser.add_argument(
         "--overwrite_cache", action="store_true", help="Overwrite the cached training and evaluation sets"
     )
+    parser.add_argument("--threads", type=int, default=1, help="multiple threads for converting example to features")
     parser.add_argument("--seed", type=int, default=42, help="random seed for initialization")
     parser.add_argument("--num_evidences", type=int, default=2, help="number of evidences to use")
 
@@ -715,6 +690,7 @@ def main():
         args.tokenizer_name if args.tokenizer_name else args.model_name_or_path,
         do_lower_case=args.do_lower_case,
         cache_dir=args.cache_dir,
+        use_fast=True,
     )
 
     model = MultiTaskBertForEvidenceBasedClassification.from_pretrained_multitask(
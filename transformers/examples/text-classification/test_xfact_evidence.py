@@ -0,0 +1,100 @@
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import xfact_evidence
+from transformers import BertTokenizer
+from xfact_evidence import InputExample
+
+
+def truncate_longest_first(ids, pair_ids, num_tokens_to_remove):
+    """ The "longest_first" loop of the slow tokenizers, one token at a time. """
+    for _ in range(num_tokens_to_remove):
+        if len(ids) > len(pair_ids):
+            ids = ids[:-1]
+        else:
+            pair_ids = pair_ids[:-1]
+    return ids, pair_ids
+
+
+class XFactEvidenceEncodingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdirname = tempfile.mkdtemp()
+        vocab_tokens = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "the", "claim", "is", "false", "true", "says", "a"]
+        vocab_file = os.path.join(self.tmpdirname, "vocab.txt")
+        with open(vocab_file, "w", encoding="utf-8") as vocab_writer:
+            vocab_writer.write("".join([x + "\n" for x in vocab_tokens]))
+        # The encoders follow the slow tokenizer, the fast one breaks "longest_first" ties on the other sequence
+        self.tokenizer = BertTokenizer(vocab_file)
+        xfact_evidence.xfact_convert_examples_to_features_init(self.tokenizer)
+
+        words = ["the", "claim", "is", "false", "true", "says", "a", "unknown"]
+        self.examples = [
+            InputExample(
+                example_id="dev-{}".format(i),
+                question=" ".join(words[: 1 + i % 7] * (1 + i % 3)),
+                contexts=[" ".join(words[j % 8 :] * (i % 4)) or "a" for j in range(i, i + 3)],
+                label="false",
+            )
+            for i in range(24)
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdirname)
+
+    def test_truncate_pair_lengths(self):
+        for len_a, len_b, budget in itertools.product(range(12), range(12), range(1, 25)):
+            ids, pair_ids = truncate_longest_first(
+                list(range(len_a)), list(range(len_b)), max(len_a + len_b - budget, 0)
+            )
+            self.assertEqual(xfact_evidence._truncate_pair_lengths(len_a, len_b, budget), (len(ids), len(pair_ids)))
+
+        len_a, len_b = np.array([0, 3, 9, 20]), np.array([5, 3, 2, 20])
+        kept_a, kept_b = xfact_evidence._truncate_pair_lengths(len_a, len_b, 10)
+        self.assertListEqual(kept_a.tolist(), [0, 3, 8, 5])
+        self.assertListEqual(kept_b.tolist(), [5, 3, 2, 5])
+
+    def test_evidence_encode_examples(self):
+        for max_length in (8, 16, 40):
+            inputs = xfact_evidence.xfact_evidence_encode_examples(self.examples, max_length, 3)
+            expected = self.tokenizer(
+                [example.question for example in self.examples for _ in example.contexts],
+                [context for example in self.examples for context in example.contexts],
+                max_length=max_length,
+                truncation=True,
+                padding="max_length",
+            )
+            for name in ("input_ids", "token_type_ids", "attention_mask"):
+                self.assertEqual(inputs[name].shape, (len(self.examples), 3, max_length))
+                self.assertListEqual(inputs[name].reshape(-1, max_length).tolist(), expected[name])
+
+    def test_claim_evidence_encode_examples(self):
+        max_length = 8
+        inputs = xfact_evidence.xfact_claim_evidence_encode_examples(self.examples, max_length, 3)
+        texts = [text for example in self.examples for text in [example.question] + example.contexts]
+        expected = self.tokenizer(texts, max_length=max_length, truncation=True, padding="max_length")
+        for name in ("input_ids", "token_type_ids", "attention_mask"):
+            self.assertEqual(inputs[name].shape, (len(self.examples), 4, max_length))
+            self.assertListEqual(inputs[name].reshape(-1, max_length).tolist(), expected[name])
+
+    def test_left_padding(self):
+        self.tokenizer.padding_side = "left"
+        inputs = xfact_evidence.xfact_evidence_encode_examples(self.examples, 16, 3)
+        expected = self.tokenizer(
+            [example.question for example in self.examples for _ in example.contexts],
+            [context for example in self.examples for context in example.contexts],
+            max_length=16,
+            truncation=True,
+            padding="max_length",
+        )
+        self.assertListEqual(inputs["input_ids"].reshape(-1, 16).tolist(), expected["input_ids"])
+        self.assertListEqual(inputs["attention_mask"].reshape(-1, 16).tolist(), expected["attention_mask"])
+
+    def test_empty_examples(self):
+        features = xfact_evidence.xfact_evidence_convert_examples_to_features([], ["false"], 16, self.tokenizer, num_evidences=3)
+        self.assertEqual(len(features), 0)
+        self.assertEqual(features.input_ids.shape, (0, 3, 16))
@@ -16,20 +16,42 @@
 """ XNLI utils (dataset loading and evaluation) """
 
 
+import csv
+import hashlib
 import logging
 import os
-import csv
-import random
+import sys
 import tqdm
 import json
 import glob
+import shutil
+import numpy as np
 from filelock import FileLock
+from collections import Counter
 from dataclasses import dataclass
+from functools import partial
+from itertools import chain
+from multiprocessing import Pool, cpu_count
 from typing import List, Optional
 from transformers import PreTrainedTokenizer
 
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pyarrow import csv as pa_csv
+
+    _pyarrow_available = True
+except ImportError:
+    _pyarrow_available = False
+
 logger = logging.getLogger(__name__)
 
+# Bump whenever the layout of the saved features changes, so older caches are not picked up
+FEATURES_CACHE_VERSION = 3
+
+# Masks and segment ids only hold small values, one byte per token is enough
+FEATURE_DTYPES = {"input_ids": np.int32, "attention_mask": np.uint8, "token_type_ids": np.uint8}
+
 @dataclass(frozen=True)
 class InputExample:
     """
@@ -51,29 +73,39 @@ class InputExample:
 
 
 def get_metadata(line):
-    claimant = line[-3].strip()
-    review_date = line[-4].strip()
-    language = line[0].strip()
-    site = line[1].strip()
-    claim_date = line[-5].strip()
-
-    s = 'language : ' + str(language) + ', site : ' + str(site) + ', claimant : ' + str(claimant) + ', claim_date : ' + str(claim_date) + ', review_date: ' + str(review_date)
-    return s
+    return (
+        f"language : {line[0].strip()}, site : {line[1].strip()}, claimant : {line[-3].strip()}, "
+        f"claim_date : {line[-5].strip()}, review_date: {line[-4].strip()}"
+    )
 
 
 @dataclass(frozen=True)
-class InputFeatures:
+class XFactEvidenceFeatures:
     """
-    A single set of features of data.
-    Property names are the same names as the corresponding inputs to a model.
+    Features of a whole data set, stored as one array per model input.
+    `input_ids[i, k]` holds the k-th row (evidence, or claim for the claim/evidence models) of example i.
+
+    Args:
+        input_ids: int32 array of shape `(num_examples, num_rows, max_length)`.
+        attention_mask: (Optional) uint8 array of the same shape as `input_ids`.
+        token_type_ids: (Optional) uint8 array of the same shape as `input_ids`.
+        labels: int64 array of shape `(num_examples,)`.
     """
 
-    example_id: str
-    input_ids: List[List[int]]
-    attention_mask: Optional[List[List[int]]]
-    token_type_ids: Optional[List[List[int]]]
-    label: Optional[int]
+    input_ids: np.ndarray
+    attention_mask: Optional[np.ndarray]
+    token_type_ids: Optional[np.ndarray]
+    labels: np.ndarray
 
+    def __len__(self):
+        return len(self.labels)
+
+    def arrays(self):
+        return {name: array for name, array in vars(self).items() if array is not None}
+
+    def __getitem__(self, index):
+        """Returns the model inputs of the example(s) at `index` as a dict of array views."""
+        return {name: array[index] for name, array in self.arrays().items()}
 
 
 class DataProcessor:
@@ -96,11 +128,33 @@ class DataProcessor:
         raise NotImplementedError()
 
     @classmethod
-    def _read_tsv(cls, input_file, quotechar=None):
-        """Reads a tab separated value file."""
+    def _read_tsv_table(cls, input_file, quotechar=None):
+        """Reads a tab separated value file into a `pyarrow.Table` with one string column per field."""
         print('Loading from file ', input_file)
         with open(input_file, "r", encoding="utf-8-sig") as f:
-            return list(csv.reader(f, delimiter="\t", quotechar=quotechar))
+            header = f.readline().rstrip("\r\n").split("\t")
+        return pa_csv.read_csv(
+            input_file,
+            parse_options=pa_csv.ParseOptions(delimiter="\t", quote_char=quotechar or False),
+            convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in header}),
+        )
+
+    @classmethod
+    def _read_tsv(cls, input_file, quotechar=None):
+        """Reads a tab separated value file and yields its rows, without the header row."""
+        if _pyarrow_available:
+            table = cls._read_tsv_table(input_file, quotechar=quotechar)
+            # Columns are converted to Python lists once, the header row is consumed by the reader
+            yield from zip(*(column.to_pylist() for column in table.columns))
+        else:
+            print('Loading from file ', input_file)
+            # Evidence snippets can exceed the default field size limit of the csv module
+            csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+            with open(input_file, "r", encoding="utf-8-sig") as f:
+                quoting = csv.QUOTE_NONE if quotechar is None else csv.QUOTE_MINIMAL
+                reader = csv.reader(f, delimiter="\t", quotechar=quotechar, quoting=quoting)
+                next(reader, None)  # header
+                yield from (line for line in reader if line)
 
 
 
@@ -112,6 +166,7 @@ class XFactEvidenceProcessor(DataProcessor):
     def __init__(self, sources=None, num_evidences=3, use_metadata=False, data_dir=None):
         self.sources = sources
         self.label_sets = {}
+        self.label_sets_sorted = {}
         self.label_count = {}
         self.num_evidences = num_evidences
         self.use_metadata = use_metadata
@@ -127,43 +182,79 @@ class XFactEvidenceProcessor(DataProcessor):
 
 
         print('Loading from file train.{}.tsv'.format(source))
-        examples = []
-        if source not in self.label_sets:
-            self.label_sets[source] = set()
-            self.label_count[source] = {}
-        lines = self._read_tsv(os.path.join(data_dir, "train.{}.tsv".format(source)))
-        for (i, line) in enumerate(lines):
-            if i == 0:
-                continue
-            guid = "%s-%s" % ("train", i)
-            if len(line) == 0:
-                continue
-            evidences, claim_text, label, metadata = self.create_example(line)
-            if create_label_set:
-                self.label_sets[source].add(label)
-            else:
-                if label not in self.label_sets[source]:
-                    raise ValueError('Label {} not found in set {}'.format(label, str(self.label_sets[source])))
-            if label not in self.label_count[source]:
-                self.label_count[source][label] = 0
-            self.label_count[source][label] +=1
-            assert isinstance(claim_text, str) and  isinstance(label, str)
-            if self.use_metadata:
-                claim_text = claim_text + ' ' + metadata
-            example = InputExample(
-                        example_id=guid,
-                        question=claim_text,
-                        contexts=evidences,
-                        label=label
-                    )
-            examples.append(example)
+        examples, label_count = self._load_split(
+            os.path.join(data_dir, "train.{}.tsv".format(source)),
+            "train",
+            source,
+            strict_labels=True,
+            create_label_set=create_label_set,
+        )
+        self.label_count[source] = dict(label_count)
         print('Examples loaded from source {} : {}'.format(source, len(examples)))
 
-        random.shuffle(examples)
         print(examples[:5])
         #return examples[:5000]
         return examples
 
+    def _load_split(self, input_file, split_name, source, strict_labels, create_label_set=False):
+        """
+        Loads the examples of one split of `source`.
+
+        With `create_label_set`, the labels found in the file become the label set of `source`. Otherwise a label
+        outside that set raises a `ValueError` if `strict_labels` is True, and its example is skipped if not.
+        Returns the examples and a `Counter` of all the labels in the file.
+        """
+        label_set = None if create_label_set else self.label_sets[source]
+        if _pyarrow_available:
+            examples, label_count = self._load_table(self._read_tsv_table(input_file), split_name, label_set)
+        else:
+            labels = []
+            examples = []
+            for (i, line) in enumerate(self._read_tsv(input_file), start=1):
+                label = line[-1].lower()
+                labels.append(label)
+                if label_set is None or label in label_set:
+                    examples.append(self.create_input_example("%s-%s" % (split_name, i), line))
+            label_count = Counter(labels)
+
+        if create_label_set:
+            self.label_sets[source] = frozenset(label_count)
+        elif strict_labels:
+            for label in label_count:
+                if label not in label_set:
+                    raise ValueError('Label {} not found in set {}'.format(label, str(label_set)))
+        return examples, label_count
+
+    def _load_table(self, table, split_name, label_set):
+        """
+        Builds the examples of `table` whose label is in `label_set` (all of them if it is None) and counts the labels.
+        The label column is counted and filtered as a whole, rows are only visited to build the examples.
+        """
+        labels = pc.utf8_lower(table.columns[-1])
+        label_count = Counter(labels.to_pylist())
+        row_numbers = range(1, table.num_rows + 1)
+        if label_set is not None and not label_set.issuperset(label_count):
+            keep = pc.is_in(labels, value_set=pa.array(sorted(label_set), type=pa.string()))
+            row_numbers = (np.flatnonzero(keep.to_numpy()) + 1).tolist()
+            table = table.filter(keep)
+
+        # Columns are converted to Python lists once, the header row is consumed by the reader
+        lines = zip(*(column.to_pylist() for column in table.columns))
+        examples = [self.create_input_example("%s-%s" % (split_name, i), line) for i, line in zip(row_numbers, lines)]
+        return examples, label_count
+
+    def create_input_example(self, guid, line):
+        evidences, claim_text, label, metadata = self.create_example(line)
+        assert isinstance(claim_text, str) and  isinstance(label, str)
+        if self.use_metadata:
+            claim_text = claim_text + ' ' + metadata
+        return InputExample(
+                    example_id=guid,
+                    question=claim_text,
+                    contexts=evidences,
+                    label=label
+                )
+
     def create_example(self, line):
 
         evidences = []
@@ -172,42 +263,18 @@ class XFactEvidenceProcessor(DataProcessor):
 
         claim_text = line[-2]
         label = line[-1].lower()
-        metadata = get_metadata(line)
+        metadata = get_metadata(line) if self.use_metadata else None
         return evidences, claim_text, label, metadata
 
     def get_dev_examples(self, data_dir, source, filename=None):
         """See base class."""
 
-        examples = []
-        examples_skipped = 0
         if filename is None:
-            lines = self._read_tsv(os.path.join(data_dir, "dev.{}.tsv".format(source)))
+            input_file = os.path.join(data_dir, "dev.{}.tsv".format(source))
         else:
-            #source = ''
-            lines = self._read_tsv(os.path.join(data_dir, filename))
-        #lines = self._read_tsv(os.path.join(data_dir, "train.{}.tsv".format(source)))
-        for (i, line) in enumerate(lines):
-            if i == 0:
-                continue
-            guid = "%s-%s" % ("train", i)
-            if len(line) == 0:
-                continue
-            evidences, claim_text, label, metadata  = self.create_example(line)
-            if label not in self.label_sets[source]:
-                #print('Skipping test example')
-                examples_skipped +=1
-                continue
-            assert isinstance(claim_text, str) and  isinstance(label, str)
-
-            if self.use_metadata:
-                claim_text = claim_text + ' ' + metadata
-            example = InputExample(
-                        example_id=guid,
-                        question=claim_text,
-                        contexts=evidences,
-                        label=label
-                    )
-            examples.append(example)
+            input_file = os.path.join(data_dir, filename)
+        examples, label_count = self._load_split(input_file, "dev", source, strict_labels=False)
+        examples_skipped = sum(label_count.values()) - len(examples)
         if filename is None:
             print('For source: {}, dev examples skipped: {}, Examples left: {}'.format(source, examples_skipped, len(examples)))
         else:
@@ -215,197 +282,358 @@ class XFactEvidenceProcessor(DataProcessor):
         return examples
 
     def sort_label_set(self):
-        sorted_sets = {}
-
+        # Label sets stay hashed for the membership checks, the sorted lists fix the label order
         for key, val in self.label_sets.items():
-            sorted_sets[key] = sorted(list(val))
-
-        self.label_sets = sorted_sets
+            self.label_sets[key] = frozenset(val)
+            self.label_sets_sorted[key] = sorted(val)
 
     def get_test_examples(self, data_dir, source):
         """See base class."""
 
-        examples = []
-        examples_skipped = 0
-        lines = self._read_tsv(os.path.join(data_dir, "test.{}.tsv".format(source)))
-        for (i, line) in enumerate(lines):
-            if i == 0:
-                continue
-            guid = "%s-%s" % ("train", i)
-            if len(line) == 0:
-                continue
-            evidences, claim_text, label, metadata  = self.create_example(line)
-            if label not in self.label_sets[source]:
-                #print('Skipping test example')
-                examples_skipped +=1
-                continue
-            assert isinstance(claim_text, str) and  isinstance(label, str)
-            if self.use_metadata:
-                claim_text = claim_text + ' ' + metadata
-            example = InputExample(
-                        example_id=guid,
-                        question=claim_text,
-                        contexts=evidences,
-                        label=label
-                    )
-            examples.append(example)
+        examples, label_count = self._load_split(
+            os.path.join(data_dir, "test.{}.tsv".format(source)), "test", source, strict_labels=False
+        )
+        examples_skipped = sum(label_count.values()) - len(examples)
         print('For source: {}, test examples skipped: {}, Examples left: {}'.format(source, examples_skipped, len(examples)))
         return examples
 
     def get_labels(self):
         """See base class."""
         self.sort_label_set()
-        return self.label_sets
-
-
-def xfact_evidence_convert_examples_to_features(
-    examples: List[InputExample], label_list: List[str], max_length: int, tokenizer: PreTrainedTokenizer,
-) -> List[InputFeatures]:
-    """
-    Loads a data file into a list of `InputFeatures`
-    """
+        return self.label_sets_sorted
 
-    label_map = {label: i for i, label in enumerate(label_list)}
-
-    features = []
-    for (ex_index, example) in tqdm.tqdm(enumerate(examples), desc="convert examples to features"):
-        if ex_index % 10000 == 0:
-            logger.info("Writing example %d of %d" % (ex_index, len(examples)))
-        choices_inputs = []
-        for ending_idx, context in enumerate(example.contexts):
-            #text_a = context
-            #text_b = example.question
-            text_a = example.question
-            text_b = context
-
-            inputs = tokenizer(
-                text_a,
-                text_b,
-                add_special_tokens=True,
-                max_length=max_length,
-                padding="max_length",
-                truncation=True,
-                return_overflowing_tokens=True,
-            )
-            if "num_truncated_tokens" in inputs and inputs["num_truncated_tokens"] > 0:
-                logger.info(
-                    "Attention! you are cropping tokens (swag task is ok). "
-                    "If you are training ARC and RACE and you are poping question + options,"
-                    "you need to try to use a bigger max seq length!"
-                )
 
-            choices_inputs.append(inputs)
+def xfact_convert_examples_to_features_init(tokenizer_for_convert):
+    global tokenizer
+    tokenizer = tokenizer_for_convert
 
-        label = label_map[example.label]
-
-        input_ids = [x["input_ids"] for x in choices_inputs]
-        attention_mask = (
-            [x["attention_mask"] for x in choices_inputs] if "attention_mask" in choices_inputs[0] else None
-        )
-        token_type_ids = (
-            [x["token_type_ids"] for x in choices_inputs] if "token_type_ids" in choices_inputs[0] else None
-        )
 
+def _truncate_pair_lengths(len_a, len_b, budget: int):
+    """
+    Returns the lengths kept by the "longest_first" truncation strategy: tokens are removed one at a time
+    from the longer sequence (the second one on ties) until the pair fits in `budget` tokens.
+    Works element-wise on arrays of lengths.
+    """
+    excess = np.maximum(len_a + len_b - budget, 0)
+    # The longer sequence first loses tokens until both have the same length
+    removed_a = np.minimum(excess, np.maximum(len_a - len_b, 0))
+    removed_b = np.minimum(excess, np.maximum(len_b - len_a, 0))
+    excess = excess - removed_a - removed_b
+    # Both sequences now have the same length and lose tokens in turns, starting with the second one
+    return len_a - removed_a - excess // 2, len_b - removed_b - (excess + 1) // 2
 
-        features.append(
-            InputFeatures(
-                example_id=example.example_id,
-                input_ids=input_ids,
-                attention_mask=attention_mask,
-                token_type_ids=token_type_ids,
-                label=label,
-            )
-        )
 
-    for f in features[:2]:
-        logger.info("*** Example ***")
-        logger.info("feature: %s" % f)
+def _tokenize_without_special_tokens(texts: List[str]):
+    """
+    Tokenizes `texts` in one batched call. Returns the token ids of all texts concatenated, together with
+    the offset and the number of tokens of each text.
+    """
+    ids = tokenizer(texts, add_special_tokens=False)["input_ids"]
+    lengths = np.fromiter(map(len, ids), dtype=np.int64, count=len(ids))
+    offsets = np.cumsum(lengths) - lengths
+    flat_ids = np.fromiter(chain.from_iterable(ids), dtype=FEATURE_DTYPES["input_ids"], count=lengths.sum())
+    return flat_ids, offsets, lengths
 
-    return features
 
-def xfact_claim_evidence_convert_examples_to_features(
-    examples: List[InputExample], label_list: List[str], max_length: int, tokenizer: PreTrainedTokenizer,
-) -> List[InputFeatures]:
+def _special_tokens_template(num_sequences: int):
     """
-    Loads a data file into a list of `InputFeatures`
+    Returns how the tokenizer wraps `num_sequences` (1 or 2) sequences with special tokens, as a tuple
+    `(special_ids, special_type_ids, sequence_type_ids)`: the special token ids (and their token type ids)
+    before, between and after the sequences, and the token type id of each sequence.
     """
-
+    # Placeholder sequences of different lengths, so their positions in the output can be told apart
+    probes = [[-1] * 2, [-2] * 3][:num_sequences]
+    input_ids = np.array(tokenizer.build_inputs_with_special_tokens(*probes))
+    token_type_ids = np.array(tokenizer.create_token_type_ids_from_sequences(*probes))
+    special_ids, special_type_ids, sequence_type_ids = [], [], []
+    start = 0
+    for probe in probes:
+        positions = np.flatnonzero(input_ids == probe[0])
+        if len(positions) != len(probe) or positions[-1] - positions[0] != len(probe) - 1 or positions[0] < start:
+            raise ValueError("Cannot vectorize the special tokens of {}".format(type(tokenizer).__name__))
+        special_ids.append(input_ids[start : positions[0]])
+        special_type_ids.append(token_type_ids[start : positions[0]])
+        sequence_type_ids.append(token_type_ids[positions[0]])
+        start = positions[-1] + 1
+    special_ids.append(input_ids[start:])
+    special_type_ids.append(token_type_ids[start:])
+    if len(token_type_ids) != len(input_ids) or any((ids < 0).any() for ids in special_ids):
+        raise ValueError("Cannot vectorize the special tokens of {}".format(type(tokenizer).__name__))
+    return special_ids, special_type_ids, sequence_type_ids
+
+
+def _allocate_inputs(shape):
+    """Returns the padded model input arrays of the given shape, rows are filled in by `_fill_rows`."""
+    inputs = {"input_ids": np.full(shape, tokenizer.pad_token_id, dtype=FEATURE_DTYPES["input_ids"])}
+    if "token_type_ids" in tokenizer.model_input_names:
+        inputs["token_type_ids"] = np.full(shape, tokenizer.pad_token_type_id, dtype=FEATURE_DTYPES["token_type_ids"])
+    if "attention_mask" in tokenizer.model_input_names:
+        inputs["attention_mask"] = np.zeros(shape, dtype=FEATURE_DTYPES["attention_mask"])
+    return inputs
+
+
+def _fill_rows(inputs, sequences):
+    """
+    Writes the rows of the arrays in `inputs` (seen as `(num_rows, max_length)`) in one go: each row holds the
+    special tokens of the tokenizer around one or two (already truncated) sequences, padded on `padding_side`.
+    `sequences` holds a tuple `(flat_ids, offsets, lengths)` per sequence, with one offset and length per row.
+    """
+    special_ids, special_type_ids, sequence_type_ids = _special_tokens_template(len(sequences))
+    rows = {name: array.reshape(-1, array.shape[-1]) for name, array in inputs.items()}
+    num_rows, max_length = rows["input_ids"].shape
+    row_index = np.arange(num_rows)
+
+    row_lengths = sum(len(ids) for ids in special_ids) + sum(lengths for _, _, lengths in sequences)
+    if tokenizer.padding_side == "left":
+        column = max_length - row_lengths
+    else:
+        column = np.zeros(num_rows, dtype=np.int64)
+    if "attention_mask" in rows:
+        columns = np.arange(max_length)
+        rows["attention_mask"][:] = (columns >= column[:, None]) & (columns < (column + row_lengths)[:, None])
+
+    for i, ids in enumerate(special_ids):
+        # The same special tokens start at a different column in every row
+        columns = column[:, None] + np.arange(len(ids))
+        rows["input_ids"][row_index[:, None], columns] = ids
+        if "token_type_ids" in rows:
+            rows["token_type_ids"][row_index[:, None], columns] = special_type_ids[i]
+        column = column + len(ids)
+        if i == len(sequences):
+            break
+        # Gather all kept tokens of sequence i at once: token j of a row comes from `flat_ids[offset + j]`
+        flat_ids, offsets, lengths = sequences[i]
+        token_rows = np.repeat(row_index, lengths)
+        positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        columns = np.repeat(column, lengths) + positions
+        rows["input_ids"][token_rows, columns] = flat_ids[np.repeat(offsets, lengths) + positions]
+        if "token_type_ids" in rows:
+            rows["token_type_ids"][token_rows, columns] = sequence_type_ids[i]
+        column = column + lengths
+
+
+def xfact_evidence_encode_examples(examples: List[InputExample], max_length: int, num_evidences: int):
+    """
+    Encodes the (claim, evidence) pairs of `examples`. Every claim and evidence is tokenized once, in one
+    batched tokenizer call, and the pairs are assembled from the token ids with array operations.
+    Returns a dict mapping each model input name to an array of shape `(len(examples), num_evidences, max_length)`.
+    """
+    assert all(len(example.contexts) == num_evidences for example in examples)
+    inputs = _allocate_inputs((len(examples), num_evidences, max_length))
+    if not examples:
+        return inputs
+    claim_ids, claim_offsets, claim_lengths = _tokenize_without_special_tokens([example.question for example in examples])
+    context_ids, context_offsets, context_lengths = _tokenize_without_special_tokens(
+        [context for example in examples for context in example.contexts]
+    )
+    budget = max_length - tokenizer.num_special_tokens_to_add(pair=True)
+
+    # One row per (claim, evidence) pair, the claim is repeated for each of its evidences
+    claim_offsets = np.repeat(claim_offsets, num_evidences)
+    claim_lengths = np.repeat(claim_lengths, num_evidences)
+    len_a, len_b = _truncate_pair_lengths(claim_lengths, context_lengths, budget)
+    _fill_rows(inputs, [(claim_ids, claim_offsets, len_a), (context_ids, context_offsets, len_b)])
+
+    num_truncated = np.count_nonzero(len_a + len_b < claim_lengths + context_lengths)
+    if num_truncated > 0:
+        logger.info("%d of %d claim/evidence pairs were truncated to %d tokens" % (num_truncated, len(context_lengths), max_length))
+    return inputs
+
+
+def xfact_claim_evidence_encode_examples(examples: List[InputExample], max_length: int, num_evidences: int):
+    """
+    Encodes claims and evidences of `examples` as separate sequences. Every claim and evidence is tokenized
+    once, in one batched tokenizer call, and the rows are assembled from the token ids with array operations.
+    Returns a dict mapping each model input name to an array of shape
+    `(len(examples), num_evidences + 1, max_length)`, the claim row followed by the evidence rows.
+    """
+    assert all(len(example.contexts) == num_evidences for example in examples)
+    inputs = _allocate_inputs((len(examples), num_evidences + 1, max_length))
+    if not examples:
+        return inputs
+    claim_ids, claim_offsets, claim_lengths = _tokenize_without_special_tokens([example.question for example in examples])
+    context_ids, context_offsets, context_lengths = _tokenize_without_special_tokens(
+        [context for example in examples for context in example.contexts]
+    )
+    budget = max_length - tokenizer.num_special_tokens_to_add(pair=False)
+
+    # Claims and evidences share one id buffer, the claim of each example goes first
+    ids = np.concatenate([claim_ids, context_ids])
+    offsets = np.column_stack([claim_offsets, context_offsets.reshape(-1, num_evidences) + len(claim_ids)]).ravel()
+    lengths = np.column_stack([claim_lengths, context_lengths.reshape(-1, num_evidences)]).ravel()
+    _fill_rows(inputs, [(ids, offsets, np.minimum(lengths, budget))])
+
+    num_truncated = np.count_nonzero(lengths > budget)
+    if num_truncated > 0:
+        logger.info("%d of %d claims/evidences were truncated to %d tokens" % (num_truncated, len(lengths), max_length))
+    return inputs
+
+
+def _encode_examples(encode_fn, examples, tokenizer, max_length, num_evidences=None, threads=1, chunk_size=1000):
+    """
+    Runs `encode_fn` over chunks of `examples`, in a pool of `threads` worker processes when `threads > 1`,
+    and concatenates the per-chunk outputs. `num_evidences` defaults to the number of contexts of the first example.
+    """
+    if num_evidences is None:
+        num_evidences = len(examples[0].contexts) if examples else 0
+    # An empty list still goes through one (empty) chunk, so the arrays keep their number of rows
+    chunks = [examples[i : i + chunk_size] for i in range(0, len(examples), chunk_size)] or [examples]
+    encode_ = partial(encode_fn, max_length=max_length, num_evidences=num_evidences)
+    threads = min(threads, cpu_count())
+    if threads > 1:
+        with Pool(threads, initializer=xfact_convert_examples_to_features_init, initargs=(tokenizer,)) as p:
+            encoded_chunks = list(tqdm.tqdm(p.imap(encode_, chunks), total=len(chunks), desc="tokenize examples"))
+    else:
+        xfact_convert_examples_to_features_init(tokenizer)
+        encoded_chunks = [encode_(chunk) for chunk in tqdm.tqdm(chunks, desc="tokenize examples")]
+
+    return {key: np.concatenate([chunk[key] for chunk in encoded_chunks]) for key in encoded_chunks[0]}
+
+
+def _build_features(examples, encoded, label_list):
     label_map = {label: i for i, label in enumerate(label_list)}
 
-    features = []
-    for (ex_index, example) in tqdm.tqdm(enumerate(examples), desc="convert examples to features"):
-        if ex_index % 10000 == 0:
-            logger.info("Writing example %d of %d" % (ex_index, len(examples)))
-        claim = example.question
-        claim_inputs = tokenizer(
-                 claim,
-                None,
-                add_special_tokens=True,
-                max_length=max_length,
-                padding="max_length",
-                truncation=True,
-                return_overflowing_tokens=True,
-            )
-        if "num_truncated_tokens" in claim_inputs and claim_inputs["num_truncated_tokens"] > 0:
-            logger.info(
-                "Attention! you are cropping tokens (swag task is ok). "
-                "If you are training ARC and RACE and you are poping question + options,"
-                "you need to try to use a bigger max seq length!"
-            )
-
-        choices_inputs = []
-        choices_inputs.append(claim_inputs)
-
-        for ending_idx, context in enumerate(example.contexts):
-            #text_a = context
-            #text_b = example.question
-            text_a = example.question
-            text_b = context
-
-            inputs = tokenizer(
-                text_b,
-                None,
-                add_special_tokens=True,
-                max_length=max_length,
-                padding="max_length",
-                truncation=True,
-                return_overflowing_tokens=True,
-            )
-            if "num_truncated_tokens" in inputs and inputs["num_truncated_tokens"] > 0:
-                logger.info(
-                    "Attention! you are cropping tokens (swag task is ok). "
-                    "If you are training ARC and RACE and you are poping question + options,"
-                    "you need to try to use a bigger max seq length!"
-                )
+    features = XFactEvidenceFeatures(
+        input_ids=encoded["input_ids"],
+        attention_mask=encoded.get("attention_mask"),
+        token_type_ids=encoded.get("token_type_ids"),
+        labels=np.array([label_map[example.label] for example in examples], dtype=np.int64),
+    )
 
-            choices_inputs.append(inputs)
+    for ex_index in range(min(2, len(examples))):
+        logger.info("*** Example ***")
+        logger.info("example_id: %s" % examples[ex_index].example_id)
+        for name, value in features[ex_index].items():
+            logger.info("%s: %s" % (name, value.tolist()))
 
-        label = label_map[example.label]
+    return features
 
-        input_ids = [x["input_ids"] for x in choices_inputs]
-        attention_mask = (
-            [x["attention_mask"] for x in choices_inputs] if "attention_mask" in choices_inputs[0] else None
-        )
-        token_type_ids = (
-            [x["token_type_ids"] for x in choices_inputs] if "token_type_ids" in choices_inputs[0] else None
-        )
 
+def xfact_evidence_convert_examples_to_features(
+    examples: List[InputExample],
+    label_list: List[str],
+    max_length: int,
+    tokenizer: PreTrainedTokenizer,
+    threads: int = 1,
+    num_evidences: Optional[int] = None,
+) -> XFactEvidenceFeatures:
+    """
+    Loads a data file into `XFactEvidenceFeatures`
 
-        features.append(
-            InputFeatures(
-                example_id=example.example_id,
-                input_ids=input_ids,
-                attention_mask=attention_mask,
-                token_type_ids=token_type_ids,
-                label=label,
-            )
-        )
+    Each example yields one (claim, evidence) row per evidence. Tokenization runs on chunks
+    of examples, spread over `threads` processes. Pass `num_evidences` to get correctly shaped (empty) arrays
+    when `examples` may be empty.
+    """
+    encoded = _encode_examples(
+        xfact_evidence_encode_examples, examples, tokenizer, max_length, num_evidences=num_evidences, threads=threads
+    )
+    return _build_features(examples, encoded, label_list)
 
-    for f in features[:2]:
-        logger.info("*** Example ***")
-        logger.info("feature: %s" % f)
+def xfact_claim_evidence_convert_examples_to_features(
+    examples: List[InputExample],
+    label_list: List[str],
+    max_length: int,
+    tokenizer: PreTrainedTokenizer,
+    threads: int = 1,
+    num_evidences: Optional[int] = None,
+) -> XFactEvidenceFeatures:
+    """
+    Loads a data file into `XFactEvidenceFeatures`
 
-    return features
+    Each example yields a claim row followed by one row per evidence. Tokenization runs on chunks
+    of examples, spread over `threads` processes. Pass `num_evidences` to get correctly shaped (empty) arrays
+    when `examples` may be empty.
+    """
+    encoded = _encode_examples(
+        xfact_claim_evidence_encode_examples, examples, tokenizer, max_length, num_evidences=num_evidences, threads=threads
+    )
+    return _build_features(examples, encoded, label_list)
+
+
+def _sha256_file(path, block_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def xfact_evidence_features_cache_key(
+    input_file: str,
+    tokenizer: PreTrainedTokenizer,
+    tokenizer_name: str,
+    max_length: int,
+    num_evidences: int,
+    use_metadata: bool,
+    label_list: List[str],
+    convert_fn,
+) -> str:
+    """
+    Returns a hex digest identifying the features `convert_fn` produces for `input_file`.
+    The digest covers the cache layout version, the tokenizer (name, class and vocabulary), the conversion
+    settings and the content of the input file, so a stale cache is never picked up after any of them changes.
+    """
+    vocab = json.dumps(sorted(tokenizer.get_vocab().items()), ensure_ascii=False)
+    key = [
+        FEATURES_CACHE_VERSION,
+        tokenizer_name,
+        type(tokenizer).__name__,
+        tokenizer.init_kwargs.get("do_lower_case"),
+        hashlib.sha256(vocab.encode("utf-8")).hexdigest(),
+        max_length,
+        num_evidences,
+        use_metadata,
+        list(label_list),
+        convert_fn.__name__,
+        _sha256_file(input_file),
+    ]
+    return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+
+
+def save_xfact_evidence_features(features: XFactEvidenceFeatures, cache_dir: str):
+    """
+    Saves `features` as one `.npy` file per array under `cache_dir`.
+    The directory is written next to its final location and renamed, so readers never see a partial cache.
+    The attention mask only holds 0/1 values and is stored bit-packed along its last axis, together with its shape.
+    """
+    tmp_dir = cache_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, array in features.arrays().items():
+        if name == "attention_mask":
+            np.save(os.path.join(tmp_dir, "attention_mask_shape.npy"), np.asarray(array.shape, dtype=np.int64))
+            array = np.packbits(array, axis=-1)
+        np.save(os.path.join(tmp_dir, name + ".npy"), array)
+    if os.path.isfile(cache_dir):
+        os.remove(cache_dir)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.rename(tmp_dir, cache_dir)
+
+
+def xfact_evidence_features_cache_exists(cache_dir: str) -> bool:
+    """Returns whether `cache_dir` holds a complete set of features written by `save_xfact_evidence_features`."""
+    if not os.path.isdir(cache_dir):
+        return False
+    files = set(os.listdir(cache_dir))
+    if not {"input_ids.npy", "labels.npy"} <= files:
+        return False
+    return "attention_mask.npy" not in files or "attention_mask_shape.npy" in files
+
+
+def load_xfact_evidence_features(cache_dir: str) -> XFactEvidenceFeatures:
+    """
+    Loads features saved by `save_xfact_evidence_features`. The arrays are memory-mapped (copy-on-write),
+    so pages are only read from disk when a batch needs them.
+    """
+    arrays = {}
+    for name in ("input_ids", "attention_mask", "token_type_ids", "labels"):
+        path = os.path.join(cache_dir, name + ".npy")
+        arrays[name] = np.load(path, mmap_mode="c") if os.path.exists(path) else None
+    if arrays["attention_mask"] is not None:
+        shape = tuple(np.load(os.path.join(cache_dir, "attention_mask_shape.npy")))
+        unpacked = np.unpackbits(arrays["attention_mask"], axis=-1, count=shape[-1])
+        arrays["attention_mask"] = unpacked.reshape(shape).astype(FEATURE_DTYPES["attention_mask"], copy=False)
+    return XFactEvidenceFeatures(**arrays)
 
 
 
@@ -18,7 +18,6 @@
 
 import logging
 import os
-import random
 
 from .utils import DataProcessor, InputExample
 
@@ -26,14 +25,10 @@ from .utils import DataProcessor, InputExample
 logger = logging.getLogger(__name__)
 
 def get_metadata(line):
-    claimant = line[-3].strip()
-    review_date = line[-4].strip()
-    language = line[0].strip()
-    site = line[1].strip()
-    claim_date = line[-5].strip()
-
-    s = 'language : ' + str(language) + ', site : ' + str(site) + ', claimant : ' + str(claimant) + ', claim_date : ' + str(claim_date) + ', review_date: ' + str(review_date)
-    return s
+    return (
+        f"language : {line[0].strip()}, site : {line[1].strip()}, claimant : {line[-3].strip()}, "
+        f"claim_date : {line[-5].strip()}, review_date: {line[-4].strip()}"
+    )
 
 
 class XFactProcessor(DataProcessor):
@@ -43,6 +38,7 @@ class XFactProcessor(DataProcessor):
     def __init__(self, sources=None, data_dir=None, use_metadata=False):
         self.sources = sources
         self.label_sets = {}
+        self.label_sets_sorted = {}
         self.label_count = {}
         self.use_metadata = use_metadata
         if data_dir is not None:
@@ -70,7 +66,6 @@ class XFactProcessor(DataProcessor):
                 continue
             claim_text = line[-2]
             label = line[-1].lower()
-            metadata = get_metadata(line)
             if create_label_set:
                 self.label_sets[source].add(label)
             else:
@@ -81,11 +76,10 @@ class XFactProcessor(DataProcessor):
             self.label_count[source][label] +=1
             assert isinstance(claim_text, str) and  isinstance(label, str)
             if self.use_metadata:
-                claim_text = claim_text + ' ' + metadata
+                claim_text = claim_text + ' ' + get_metadata(line)
             examples.append(InputExample(guid=guid, text_a=claim_text, text_b=None, label=label))
         print('Examples loaded from source {} : {}'.format(source, len(examples)))
 
-        random.shuffle(examples)
         #return examples[:1000]
         return examples
 
@@ -105,25 +99,22 @@ class XFactProcessor(DataProcessor):
             guid = "%s-%s" % ("train", i)
             claim_text = line[-2]
             label = line[-1].lower()
-            metadata = get_metadata(line)
             if label not in self.label_sets[source]:
                 #print('Skipping test example')
                 examples_skipped +=1
                 continue
             assert isinstance(claim_text, str) and  isinstance(label, str)
             if self.use_metadata:
-                claim_text = claim_text + ' ' + metadata
+                claim_text = claim_text + ' ' + get_metadata(line)
             examples.append(InputExample(guid=guid, text_a=claim_text, text_b=None, label=label))
         #print('For source: {}, dev examples skipped: {}, Examples left: {}'.format(source, examples_skipped, len(examples)))
         return examples
 
     def sort_label_set(self):
-        sorted_sets = {}
-
+        # Label sets stay hashed for the membership checks, the sorted lists fix the label order
         for key, val in self.label_sets.items():
-            sorted_sets[key] = sorted(list(val))
-
-        self.label_sets = sorted_sets
+            self.label_sets[key] = frozenset(val)
+            self.label_sets_sorted[key] = sorted(val)
 
     def get_test_examples(self, data_dir, source):
         """See base class."""
@@ -137,14 +128,13 @@ class XFactProcessor(DataProcessor):
             guid = "%s-%s" % ("train", i)
             claim_text = line[-2]
             label = line[-1].lower()
-            metadata = get_metadata(line)
             if label not in self.label_sets[source]:
                 #print('Skipping test example')
                 examples_skipped +=1
                 continue
             assert isinstance(claim_text, str) and  isinstance(label, str)
             if self.use_metadata:
-                claim_text = claim_text + ' ' + metadata
+                claim_text = claim_text + ' ' + get_metadata(line)
             examples.append(InputExample(guid=guid, text_a=claim_text, text_b=None, label=label))
         print('For source: {}, test examples skipped: {}, Examples left: {}'.format(source, examples_skipped, len(examples)))
         return examples
@@ -152,7 +142,7 @@ class XFactProcessor(DataProcessor):
     def get_labels(self):
         """See base class."""
         self.sort_label_set()
-        return self.label_sets
+        return self.label_sets_sorted
 
 
 xfact_processors = {
@@ -564,9 +564,10 @@ class MultiTaskBertForEvidenceBasedClassification(BertPreTrainedModel):
         """
         num_evidences = input_ids.shape[1] - 1 if input_ids is not None else inputs_embeds.shape[1] - 1
 
-        input_ids = input_ids.view(-1, input_ids.size(-1)) if input_ids is not None else None
+        # Features are stored as int32/uint8 arrays, embedding lookups need int64 indices
+        input_ids = input_ids.view(-1, input_ids.size(-1)).long() if input_ids is not None else None
         attention_mask = attention_mask.view(-1, attention_mask.size(-1)) if attention_mask is not None else None
-        token_type_ids = token_type_ids.view(-1, token_type_ids.size(-1)) if token_type_ids is not None else None
+        token_type_ids = token_type_ids.view(-1, token_type_ids.size(-1)).long() if token_type_ids is not None else None
         position_ids = position_ids.view(-1, position_ids.size(-1)) if position_ids is not None else None
         inputs_embeds = (
             inputs_embeds.view(-1, inputs_embeds.size(-2), inputs_embeds.size(-1))
@@ -1069,9 +1070,10 @@ class MultiTaskBertForEvidenceBasedClassificationMeanAggregator(BertPreTrainedMo
         """
         num_evidences = input_ids.shape[1] if input_ids is not None else inputs_embeds.shape[1]
 
-        input_ids = input_ids.view(-1, input_ids.size(-1)) if input_ids is not None else None
+        # Features are stored as int32/uint8 arrays, embedding lookups need int64 indices
+        input_ids = input_ids.view(-1, input_ids.size(-1)).long() if input_ids is not None else None
         attention_mask = attention_mask.view(-1, attention_mask.size(-1)) if attention_mask is not None else None
-        token_type_ids = token_type_ids.view(-1, token_type_ids.size(-1)) if token_type_ids is not None else None
+        token_type_ids = token_type_ids.view(-1, token_type_ids.size(-1)).long() if token_type_ids is not None else None
         position_ids = position_ids.view(-1, position_ids.size(-1)) if position_ids is not None else None
         inputs_embeds = (
             inputs_embeds.view(-1, inputs_embeds.size(-2), inputs_embeds.size(-1))